@@ -0,0 +1,18 @@
+#!/bin/bash
+# Clone the primary with pg_basebackup and start as a hot standby
+set -e
+export PGPASSWORD="$POSTGRES_PASSWORD"
+
+mkdir -p "$PGDATA"
+chown postgres:postgres "$PGDATA"
+chmod 700 "$PGDATA"
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+  until gosu postgres pg_basebackup -h db -U "$POSTGRES_USER" -D "$PGDATA" -X stream -R; do
+    echo "Waiting for primary..."
+    rm -rf "${PGDATA:?}"/*
+    sleep 2
+  done
+fi
+
+exec gosu postgres postgres -c hot_standby=on
@@ -1,10 +1,178 @@
-from django.contrib import admin
+import datetime
+import json
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 # Register your models here.
-from .models import FlightEvent
+from .index import flight_index
+from .models import FlightEvent, FlightEventChangeSet
+from .services import FlightEventService
+
+ROUTES_CACHE_TIMEOUT = 60 * 15
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    On PostgreSQL use the planner's row estimate instead of COUNT(*) for
+    large tables. Results under EXACT_COUNT_LIMIT rows are counted exactly.
+    """
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+
+        estimate = self.estimate_count(queryset, connection)
+        if estimate < self.EXACT_COUNT_LIMIT:
+            return super().count
+        return estimate
+
+    @staticmethod
+    def estimate_count(queryset, connection) -> int:
+        if not queryset.query.where:
+            # Whole table: row estimate kept by VACUUM/ANALYZE (-1 if never analyzed)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            return row[0] if row else -1
+
+        # EXPLAIN (FORMAT JSON) returns a list holding the plan
+        plan = json.loads(queryset.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class DateRangeQuerySet(QuerySet):
+    """
+    Year and month choices of the admin date hierarchy from the MIN/MAX of
+    the field, two index lookups, instead of a DISTINCT date_trunc over
+    every row. Periods between the first and last flight are all listed.
+    """
+    range_kinds = ('year', 'month')
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in self.range_kinds:
+            return super().datetimes(field_name, kind, order, tzinfo)
+
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        first = timezone.localtime(bounds['first'], tzinfo)
+        last = timezone.localtime(bounds['last'], tzinfo)
+
+        periods = []
+        year, month = first.year, first.month if kind == 'month' else 1
+        while (year, month) <= (last.year, last.month if kind == 'month' else 1):
+            periods.append(timezone.make_aware(datetime.datetime(year, month, 1), first.tzinfo))
+            if kind == 'month' and month < 12:
+                month += 1
+            else:
+                year, month = year + 1, 1
+        return periods if order == 'ASC' else periods[::-1]
+
+
+def route_choices():
+    """(departure_city, arrival_city) pairs, from the flight index or a cached query"""
+    if flight_index.loaded:
+        return flight_index.routes()
+
+    # A new change set means the routes may have changed
+    version = FlightEventChangeSet.objects.aggregate(latest=Max('id'))['latest'] or 0
+    return cache.get_or_set(
+        f'flights:admin:routes:{version}',
+        lambda: set(FlightEvent.objects.values_list('departure_city', 'arrival_city').distinct()),
+        ROUTES_CACHE_TIMEOUT
+    )
+
+
+class CityFilter(admin.SimpleListFilter):
+    """City filter with choices from the route index instead of a DISTINCT per page load"""
+    route_position = 0
+
+    def lookups(self, request, model_admin):
+        cities = sorted({route[self.route_position] for route in route_choices()})
+        return [(city, city) for city in cities]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+class DepartureCityFilter(CityFilter):
+    title = 'departure city'
+    parameter_name = 'departure_city'
+    route_position = 0
+
+
+class ArrivalCityFilter(CityFilter):
+    title = 'arrival city'
+    parameter_name = 'arrival_city'
+    route_position = 1
+
 
 @admin.register(FlightEvent)
 class FlightEventAdmin(admin.ModelAdmin):
     list_display = ('flight_number', 'departure_city', 'arrival_city', 'departure_datetime')
-    list_filter = ('departure_city', 'arrival_city')
-    search_fields = ('flight_number', 'departure_city', 'arrival_city')
\ No newline at end of file
+    list_filter = (DepartureCityFilter, ArrivalCityFilter)
+    date_hierarchy = 'departure_datetime'
+    # Searching is done by get_search_results, this enables the search box
+    search_fields = ('flight_number',)
+    search_help_text = 'Flight number prefix or exact city code'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('delete_past_flights', 'revalidate_flights')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return DateRangeQuerySet(model=queryset.model, query=queryset.query, using=queryset.db)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Prefix and exact matches can use the indexes, icontains can't
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        query = Q(flight_number__startswith=search_term)
+        if len(search_term) == 3:
+            query |= Q(departure_city=search_term.upper()) | Q(arrival_city=search_term.upper())
+        return queryset.filter(query), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            FlightEventService().publish_changes(updated=[obj.id])
+        else:
+            FlightEventService().publish_changes(inserted=[obj.id])
+
+    def delete_model(self, request, obj):
+        FlightEventService().delete_flight_events(FlightEvent.objects.filter(id=obj.id))
+
+    def delete_queryset(self, request, queryset):
+        FlightEventService().delete_flight_events(queryset)
+
+    @admin.action(description='Delete past flights', permissions=['delete'])
+    def delete_past_flights(self, request, queryset):
+        deleted = FlightEventService().delete_flight_events(
+            queryset.filter(departure_datetime__lt=timezone.now())
+        )
+        self.message_user(request, f"Deleted {deleted} past flights.", messages.SUCCESS)
+
+    @admin.action(description='Re-run validation', permissions=['change', 'delete'])
+    def revalidate_flights(self, request, queryset):
+        updated, deleted = FlightEventService().revalidate_flight_events(queryset)
+        self.message_user(
+            request,
+            f"Normalized {updated} and deleted {deleted} invalid flights.",
+            messages.SUCCESS
+        )
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class FlightsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flights'
+
+    def ready(self):
+        # Connect signal receivers
+        from . import signals  # noqa: F401
+
+        # Set by gunicorn.conf.py: import the search path before serving.
+        # Database and cache warm-up runs from gunicorn once the app is loaded
+        from django.conf import settings
+        if settings.FLIGHT_WARMUP:
+            from .warmup import warm_imports
+            warm_imports()
@@ -0,0 +1,138 @@
+import multiprocessing
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from .index import flight_index
+from .services import JourneySearchService
+
+# Extra seconds to wait for a worker past the search budget before giving up
+RESULT_GRACE = 1.0
+
+
+class SearchRejected(Exception):
+    """The search queue is full"""
+
+
+def run_search(date_str: str, from_city: str, to_city: str, deadline: float) -> Tuple[List[Dict], bool]:
+    """Search in a pool process, over the index snapshot inherited from the parent"""
+    service = JourneySearchService(index=flight_index)
+    return service.search_journeys_within(date_str, from_city, to_city, budget=deadline - time.time())
+
+
+class SearchExecutor:
+    """
+    Run searches in a bounded pool of processes, so a pathological search
+    cannot block an API worker.
+
+    Pool processes are forked with the loaded flight index and never touch the
+    database. When an ingest moves the index to a new version the pool is
+    replaced, and searches already running finish on the old snapshot.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.workers = settings.SEARCH_POOL_WORKERS if workers is None else workers
+        max_queue = settings.SEARCH_POOL_QUEUE if max_queue is None else max_queue
+        self.max_pending = self.workers + max_queue
+        self._lock = threading.Lock()
+        self._pool = None
+        self._snapshot_version = None
+        self.pending = 0
+        self.metrics = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None or self._snapshot_version != flight_index.version:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('fork')
+            )
+            self._snapshot_version = flight_index.version
+        return self._pool
+
+    def search(self, date_str: str, from_city: str, to_city: str, budget: float) -> Tuple[List[Dict], bool]:
+        """
+        Search within budget seconds. Returns the journeys and whether they are
+        truncated. Callers sync flight_index first: the pool searches its version.
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.metrics['rejected'] += 1
+                raise SearchRejected('Too many searches in progress')
+            self.pending += 1
+            self.metrics['submitted'] += 1
+            pool = self._get_pool()
+
+        try:
+            future = self._submit(pool, date_str, from_city, to_city, time.time() + budget)
+        except BaseException:
+            self._release()
+            raise
+        # A running search can't be cancelled: it holds its slot until it ends
+        future.add_done_callback(self._release)
+
+        try:
+            journeys, truncated = future.result(timeout=budget + RESULT_GRACE)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.metrics['timed_out'] += 1
+            return [], True
+        except BrokenProcessPool:
+            # A pool process died, start a new pool on the next search
+            with self._lock:
+                self._discard_pool(pool)
+            raise
+
+        with self._lock:
+            self.metrics['completed'] += 1
+            if truncated:
+                self.metrics['truncated'] += 1
+        return journeys, truncated
+
+    def _submit(self, pool: ProcessPoolExecutor, *args):
+        try:
+            return pool.submit(run_search, *args)
+        except BrokenProcessPool:
+            # A pool process died while idle (e.g. OOM killed): retry once on a new pool
+            with self._lock:
+                self._discard_pool(pool)
+                pool = self._get_pool()
+            try:
+                return pool.submit(run_search, *args)
+            except BrokenProcessPool:
+                with self._lock:
+                    self._discard_pool(pool)
+                raise SearchRejected('Search pool unavailable')
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        if self._pool is pool:
+            self._pool = None
+
+    def _release(self, future=None):
+        with self._lock:
+            self.pending -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_depth': self.pending,
+                'max_pending': self.max_pending,
+                'submitted': self.metrics['submitted'],
+                'completed': self.metrics['completed'],
+                'rejected': self.metrics['rejected'],
+                'truncated': self.metrics['truncated'],
+                'timed_out': self.metrics['timed_out'],
+            }
+
+
+search_executor = SearchExecutor()
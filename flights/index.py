@@ -0,0 +1,120 @@
+import bisect
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from operator import attrgetter
+from typing import Dict, List, Optional, Set, Tuple
+from django.db.models import Max
+from .models import FlightEvent, FlightEventChangeSet
+
+departure_key = attrgetter('departure_datetime')
+
+
+class FlightIndex:
+    """
+    In-memory copy of the flight_event table grouped by departure city.
+
+    The index is loaded once and then kept current by applying the change
+    sets published by the ingest, so a refresh never reloads the whole table.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._events: Dict[int, FlightEvent] = {}
+        self._by_departure: Dict[str, List[FlightEvent]] = {}
+        # (departure_city, arrival_city) -> number of flights
+        self._routes: Counter = Counter()
+        # Id of the last change set applied, None until loaded
+        self.version: Optional[int] = None
+        self._synced_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def __len__(self):
+        return len(self._events)
+
+    def load(self):
+        """Build the index from the database"""
+        # Read the version first: change sets committed while loading are
+        # applied again by the next sync, which is harmless
+        version = FlightEventChangeSet.objects.aggregate(latest=Max('id'))['latest'] or 0
+        events = list(FlightEvent.objects.all())
+
+        with self._lock:
+            self._events = {event.id: event for event in events}
+            self._by_departure = {}
+            for event in events:
+                self._by_departure.setdefault(event.departure_city, []).append(event)
+            for flights in self._by_departure.values():
+                flights.sort(key=departure_key)
+            self._routes = Counter((event.departure_city, event.arrival_city) for event in events)
+            self.version = version
+            self._synced_at = time.monotonic()
+
+    def sync(self, max_age: Optional[float] = None):
+        """Apply the change sets published since the last sync"""
+        if not self.loaded:
+            self.load()
+            return
+
+        if max_age and time.monotonic() - self._synced_at < max_age:
+            return
+
+        for changes in FlightEventChangeSet.objects.filter(id__gt=self.version).order_by('id'):
+            self.apply(changes)
+        self._synced_at = time.monotonic()
+
+    def apply(self, changes: FlightEventChangeSet):
+        """Apply one change set"""
+        if self.version is not None and changes.id is not None and changes.id <= self.version:
+            return
+
+        fresh = FlightEvent.objects.in_bulk(changes.inserted + changes.updated)
+
+        with self._lock:
+            touched = set()
+            for event_id in list(changes.deleted) + list(fresh):
+                event = self._events.pop(event_id, None)
+                if event is not None:
+                    touched.add(event.departure_city)
+                    route = (event.departure_city, event.arrival_city)
+                    self._routes[route] -= 1
+                    if not self._routes[route]:
+                        del self._routes[route]
+
+            for event in fresh.values():
+                self._events[event.id] = event
+                touched.add(event.departure_city)
+                self._routes[(event.departure_city, event.arrival_city)] += 1
+
+            # Swap in new lists so concurrent readers never see a half-sorted one
+            for city in touched:
+                kept = [event for event in self._by_departure.get(city, [])
+                        if self._events.get(event.id) is event]
+                added = [event for event in fresh.values() if event.departure_city == city]
+                self._by_departure[city] = sorted(kept + added, key=departure_key)
+
+            if changes.id is not None:
+                self.version = max(self.version or 0, changes.id)
+
+    def departures(self, city: str, start: datetime, end: datetime,
+                   include_end: bool = False) -> List[FlightEvent]:
+        """Flights leaving city between start and end, ordered by departure"""
+        flights = self._by_departure.get(city, [])
+        lo = bisect.bisect_left(flights, start, key=departure_key)
+        if include_end:
+            hi = bisect.bisect_right(flights, end, key=departure_key)
+        else:
+            hi = bisect.bisect_left(flights, end, key=departure_key)
+        return flights[lo:hi]
+
+    def routes(self) -> Set[Tuple[str, str]]:
+        """Distinct (departure_city, arrival_city) pairs, kept up to date by load and apply"""
+        with self._lock:
+            return set(self._routes)
+
+
+flight_index = FlightIndex()
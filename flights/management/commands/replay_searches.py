@@ -0,0 +1,101 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from flights.middleware import read_search_log
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = 'Replays a JSONL log of journey searches and reports latency and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', help='JSONL file with one {"date", "from", "to", "options"} per line')
+        parser.add_argument('--url', help='Server base URL, e.g. http://localhost:8000 (default: in-process)')
+        parser.add_argument('--concurrency', type=int, default=1, help='Concurrent requests')
+        parser.add_argument('--rate', type=float, default=0, help='Requests per second, 0 for no limit')
+        parser.add_argument('--repeat', type=int, default=1, help='Times to replay the log')
+
+    def handle(self, *args, **options):
+        try:
+            searches = read_search_log(options['log']) * options['repeat']
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not searches:
+            raise CommandError('No searches to replay')
+
+        self.base_url = options['url']
+        self.local = threading.local()
+        rate = options['rate']
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(
+                lambda item: self.replay(item[1], started + item[0] / rate if rate else None),
+                enumerate(searches)
+            ))
+        elapsed = time.monotonic() - started
+
+        self.report(results, elapsed)
+
+    def replay(self, params, send_at):
+        """Send one search, returns (status, latency in seconds, X-Cache header)"""
+        if send_at is not None:
+            time.sleep(max(0, send_at - time.monotonic()))
+
+        request_started = time.monotonic()
+        try:
+            if self.base_url:
+                response = self.session().get(f"{self.base_url.rstrip('/')}{reverse('journey-search')}", params=params)
+                status = response.status_code
+            else:
+                response = self.client().get(reverse('journey-search'), params)
+                status = response.status_code
+        except Exception as e:
+            self.stderr.write(f"Error replaying {params}: {e}")
+            return None, time.monotonic() - request_started, None
+
+        return status, time.monotonic() - request_started, response.headers.get('X-Cache')
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+            self.local.client = Client(HTTP_HOST=host, raise_request_exception=False)
+        return self.local.client
+
+    def report(self, results, elapsed):
+        latencies = sorted(latency * 1000 for _, latency, _ in results)
+        errors = sum(1 for status, _, _ in results if status is None or status >= 500)
+        client_errors = sum(1 for status, _, _ in results if status is not None and 400 <= status < 500)
+        cache_headers = [cache for _, _, cache in results if cache]
+        hits = cache_headers.count('HIT')
+
+        total = len(results)
+        self.stdout.write(f"Requests:      {total} in {elapsed:.2f}s")
+        self.stdout.write(f"Throughput:    {total / elapsed:.1f} req/s")
+        self.stdout.write(
+            f"Latency (ms):  p50 {percentile(latencies, 50):.1f}  "
+            f"p95 {percentile(latencies, 95):.1f}  p99 {percentile(latencies, 99):.1f}"
+        )
+        self.stdout.write(f"Errors:        {errors} ({errors / total:.1%}), 4xx: {client_errors}")
+        if cache_headers:
+            self.stdout.write(f"Cache hits:    {hits}/{len(cache_headers)} ({hits / len(cache_headers):.1%})")
+        else:
+            self.stdout.write("Cache hits:    n/a")
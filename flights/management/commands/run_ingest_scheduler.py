@@ -0,0 +1,41 @@
+import time
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from flights.services import FlightEventService
+
+
+class Command(BaseCommand):
+    help = 'Polls the external API and ingests flight events on an interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=settings.FLIGHT_INGEST_INTERVAL,
+            help='Seconds between polls (default: FLIGHT_INGEST_INTERVAL)'
+        )
+        parser.add_argument('--once', action='store_true', help='Run a single ingest and exit')
+        parser.add_argument(
+            '--prune', action='store_true',
+            help="Delete flight events departing within the feed's window that are no longer in it"
+        )
+
+    def handle(self, *args, **options):
+        service = FlightEventService()
+
+        while True:
+            started = time.monotonic()
+            # Long running process: drop connections that went stale while sleeping
+            close_old_connections()
+
+            try:
+                changes = service.ingest_flight_events(service.fetch_flight_events(), prune=options['prune'])
+                self.stdout.write(str(changes) if not changes.is_empty else 'No changes.')
+            except (requests.RequestException, ValueError, DatabaseError) as e:
+                # Keep polling: the API or the database may be back on the next run
+                self.stderr.write(f"Error ingesting flight events: {e}")
+
+            if options['once']:
+                break
+
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,62 @@
+import json
+import random
+import threading
+from typing import Dict, List
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import reverse
+
+SEARCH_PARAMS = ('date', 'from', 'to')
+
+
+def read_search_log(path: str) -> List[Dict[str, str]]:
+    """Read the query parameters of each search in a JSONL sample log"""
+    searches = []
+    with open(path, encoding='utf-8') as log:
+        for line_number, line in enumerate(log, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON on line {line_number}: {e}")
+            params = {key: entry[key] for key in SEARCH_PARAMS if entry.get(key)}
+            params.update(entry.get('options') or {})
+            searches.append(params)
+    return searches
+
+
+class SearchSamplingMiddleware:
+    """
+    Append a sample of the journey searches to SEARCH_SAMPLE_FILE as JSON
+    lines, in the format read by the replay_searches command.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SEARCH_SAMPLE_RATE or not settings.SEARCH_SAMPLE_FILE:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self.search_path = reverse('journey-search')
+        self.sample_rate = settings.SEARCH_SAMPLE_RATE
+        self.sample_file = settings.SEARCH_SAMPLE_FILE
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if (request.path == self.search_path and request.method == 'GET'
+                and random.random() < self.sample_rate):
+            self.sample(request)
+
+        return response
+
+    def sample(self, request):
+        """Write the search parameters as one JSON line"""
+        entry = {param: request.GET.get(param) for param in SEARCH_PARAMS}
+        entry['options'] = {
+            key: value for key, value in request.GET.items() if key not in SEARCH_PARAMS
+        }
+        with self._lock:
+            with open(self.sample_file, 'a', encoding='utf-8') as sample_file:
+                sample_file.write(json.dumps(entry) + '\n')
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightEventChangeSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('inserted', models.JSONField(default=list)),
+                ('updated', models.JSONField(default=list)),
+                ('deleted', models.JSONField(default=list)),
+            ],
+            options={
+                'db_table': 'flight_event_changeset',
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:58
+
+from django.contrib.postgres.operations import AddIndexConcurrently as PostgresAddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrently(PostgresAddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY on PostgreSQL so ingests keep writing, a plain AddIndex elsewhere"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('flights', '0002_flighteventchangeset'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='flightevent',
+            index=models.Index(fields=['departure_city', 'departure_datetime'], name='flight_event_dep_city_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='flightevent',
+            index=models.Index(fields=['arrival_city'], name='flight_event_arr_city_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='flightevent',
+            index=models.Index(fields=['departure_datetime'], name='flight_event_dep_dt_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='flightevent',
+            index=models.Index(fields=['flight_number'], name='flight_event_number_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -11,6 +11,33 @@ class FlightEvent(models.Model):
 
     class Meta:
         db_table = 'flight_event'
+        indexes = [
+            # Journey search legs and admin exact city search
+            models.Index(fields=['departure_city', 'departure_datetime'], name='flight_event_dep_city_idx'),
+            models.Index(fields=['arrival_city'], name='flight_event_arr_city_idx'),
+            # Admin date hierarchy and past flights
+            models.Index(fields=['departure_datetime'], name='flight_event_dep_dt_idx'),
+            # Ingest lookups and admin prefix search (LIKE 'X12%')
+            models.Index(fields=['flight_number'], name='flight_event_number_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
-        return f"{self.flight_number} - {self.departure_city} to {self.arrival_city}"
\ No newline at end of file
+        return f"{self.flight_number} - {self.departure_city} to {self.arrival_city}"
+
+class FlightEventChangeSet(models.Model):
+    """Ids of the flight events inserted, updated or deleted by one ingest run"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    inserted = models.JSONField(default=list)
+    updated = models.JSONField(default=list)
+    deleted = models.JSONField(default=list)
+
+    class Meta:
+        db_table = 'flight_event_changeset'
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.inserted or self.updated or self.deleted)
+
+    def __str__(self):
+        return (f"Change set {self.pk}: {len(self.inserted)} inserted, "
+                f"{len(self.updated)} updated, {len(self.deleted)} deleted")
@@ -0,0 +1,105 @@
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError
+from django.db.models import Max
+
+logger = logging.getLogger(__name__)
+
+# Alias chosen for the search running in the current thread/task
+_search_alias = contextvars.ContextVar('search_alias', default=None)
+# Replica alias -> monotonic time after which it is tried again
+_unhealthy_until = {}
+# (latest change set id on the primary, monotonic time it was read)
+_primary_version = (0, None)
+
+
+def latest_change_set(alias: str) -> int:
+    """Id of the last change set visible on a database, 0 if none"""
+    from .models import FlightEventChangeSet
+
+    return FlightEventChangeSet.objects.using(alias).aggregate(latest=Max('id'))['latest'] or 0
+
+
+def primary_change_set() -> int:
+    """
+    Latest change set id on the primary, read at most once every
+    DATABASE_PRIMARY_VERSION_TTL seconds so searches stay off the primary
+    """
+    global _primary_version
+    version, read_at = _primary_version
+    now = time.monotonic()
+    if read_at is None or now - read_at >= settings.DATABASE_PRIMARY_VERSION_TTL:
+        version = latest_change_set(DEFAULT_DB_ALIAS)
+        _primary_version = (version, now)
+    return version
+
+
+def choose_read_alias() -> str:
+    """
+    Pick a healthy replica that has replayed the primary's last change set,
+    falling back to the primary. Comparing change set ids keeps searches
+    reading their writes whichever process made them.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return DEFAULT_DB_ALIAS
+
+    now = time.monotonic()
+    candidates = [alias for alias in settings.DATABASE_REPLICAS if _unhealthy_until.get(alias, 0) <= now]
+    if not candidates:
+        return DEFAULT_DB_ALIAS
+    random.shuffle(candidates)
+
+    primary_version = primary_change_set()
+    for alias in candidates:
+        try:
+            if latest_change_set(alias) >= primary_version:
+                return alias
+        except OperationalError as e:
+            logger.warning("Replica %s unavailable: %s", alias, e)
+            _unhealthy_until[alias] = now + settings.DATABASE_REPLICA_RETRY
+
+    return DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def search_reads():
+    """
+    Route the flights reads made inside the block to a replica. Nested
+    blocks reuse the alias of the outermost one.
+    """
+    if _search_alias.get() is not None:
+        yield
+        return
+
+    token = _search_alias.set(choose_read_alias())
+    try:
+        yield
+    finally:
+        _search_alias.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send flights reads made within search_reads() to a read replica.
+    Everything else, including all writes, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'flights':
+            return _search_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
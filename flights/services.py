@@ -1,21 +1,40 @@
+import time
 import requests
+from contextlib import nullcontext
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from django.db import transaction
-from .models import FlightEvent
+from typing import List, Dict, Optional, Tuple
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Length, Upper
+from .models import FlightEvent, FlightEventChangeSet
+from .index import FlightIndex
+from .routers import search_reads
+from .signals import flight_events_changed
 from django.utils import timezone
 
+# pg_advisory_xact_lock key held while a change set is published
+CHANGE_SET_LOCK_ID = 4815162342
+# Rows written (and ids published) per transaction by delete_flight_events
+# and revalidate_flight_events
+WRITE_BATCH_SIZE = 5000
+
+
 class FlightEventService:
     MOCK_API_URL = "https://mock.apidog.com/m1/814105-793312-default/flight-events"
+    REQUEST_TIMEOUT = 30
 
     @staticmethod
     def parse_datetime(dt_str: str) -> datetime:
         """Parse datetime from ISO format"""
         try:
-            return datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
+            dt = datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
         except ValueError:
-            return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
+            dt = datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
+        # Datetimes without offset are UTC
+        if timezone.is_naive(dt):
+            dt = timezone.make_aware(dt, timezone.utc)
+        return dt
 
     @staticmethod
     def format_datetime(dt: datetime) -> str:
@@ -29,7 +48,11 @@ class FlightEventService:
             'departure_datetime', 'arrival_datetime'
         ]
 
-        if not all(field in event_data for field in required_fields):
+        if not isinstance(event_data, dict) or not all(field in event_data for field in required_fields):
+            return False
+
+        # Feed items are untrusted: every field must be a string
+        if not all(isinstance(event_data[field], str) for field in required_fields):
             return False
 
         # Validate datetime formats
@@ -48,48 +71,185 @@ class FlightEventService:
                 len(event_data['arrival_city']) != 3):
             return False
 
+        return True
+
+    def fetch_flight_events(self) -> List[Dict]:
+        """Get flight events from the external API"""
+        response = requests.get(self.MOCK_API_URL, timeout=self.REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
     ###### Save flight event
-    @transaction.atomic
     def save_flight_events(self, events_data: List[Dict]) -> int:
         """
         Save multiple flight event to database
         """
-        saved_flight_events = 0
+        return len(self.ingest_flight_events(events_data).inserted)
 
+    @transaction.atomic
+    def ingest_flight_events(self, events_data: List[Dict], prune: bool = False) -> FlightEventChangeSet:
+        """
+        Insert new flight events and update changed ones with set-based queries.
+        With prune, stored events departing within the feed's window (its
+        first to last departure) that are missing from events_data are
+        deleted; this is only safe when the feed covers that whole window.
+        Returns the change set, which is published if not empty.
+        """
+        incoming = {}
         for event_data in events_data:
             if not self.is_validate_flight_event(event_data):
                 continue
 
-            try:
-                flight_event, created = FlightEvent.objects.get_or_create(
-                    flight_number=event_data['flight_number'],
-                    departure_datetime=self.parse_datetime(event_data['departure_datetime']),
-                    defaults={
-                        'departure_city': event_data['departure_city'].upper(),
-                        'arrival_city': event_data['arrival_city'].upper(),
-                        'arrival_datetime': self.parse_datetime(event_data['arrival_datetime'])
-                    }
+            departure_datetime = self.parse_datetime(event_data['departure_datetime'])
+            incoming[(event_data['flight_number'], departure_datetime)] = {
+                'departure_city': event_data['departure_city'].upper(),
+                'arrival_city': event_data['arrival_city'].upper(),
+                'arrival_datetime': self.parse_datetime(event_data['arrival_datetime']),
+            }
+
+        # Flight numbers repeat every day: only look at the feed's departure
+        # window, never at the whole history
+        departures = [departure_datetime for _, departure_datetime in incoming]
+        existing_events = FlightEvent.objects.none()
+        if departures:
+            existing_events = FlightEvent.objects.filter(
+                departure_datetime__range=(min(departures), max(departures))
+            )
+        if not prune:
+            existing_events = existing_events.filter(
+                flight_number__in={flight_number for flight_number, _ in incoming}
+            )
+        existing = {
+            (flight_event.flight_number, flight_event.departure_datetime): flight_event
+            for flight_event in existing_events
+        }
+
+        to_create = []
+        to_update = []
+        for (flight_number, departure_datetime), fields in incoming.items():
+            flight_event = existing.pop((flight_number, departure_datetime), None)
+            if flight_event is None:
+                to_create.append(FlightEvent(
+                    flight_number=flight_number,
+                    departure_datetime=departure_datetime,
+                    **fields
+                ))
+            elif any(getattr(flight_event, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(flight_event, name, value)
+                to_update.append(flight_event)
+
+        FlightEvent.objects.bulk_create(to_create)
+        FlightEvent.objects.bulk_update(to_update, ['departure_city', 'arrival_city', 'arrival_datetime'])
+
+        # Whatever is left in existing was not in the feed
+        deleted = [flight_event.id for flight_event in existing.values()] if prune else []
+        if deleted:
+            FlightEvent.objects.filter(id__in=deleted).delete()
+
+        return self.publish_changes(
+            inserted=[flight_event.id for flight_event in to_create],
+            updated=[flight_event.id for flight_event in to_update],
+            deleted=deleted,
+        )
+
+    @transaction.atomic
+    def publish_changes(self, inserted: List[int] = (), updated: List[int] = (),
+                        deleted: List[int] = ()) -> FlightEventChangeSet:
+        """
+        Record a change set and send it to the in-memory structures and
+        caches once the transaction commits. Empty change sets are not saved.
+        """
+        changes = FlightEventChangeSet(inserted=list(inserted), updated=list(updated), deleted=list(deleted))
+        if not changes.is_empty:
+            self.lock_change_sets()
+            changes.save()
+            transaction.on_commit(
+                lambda: flight_events_changed.send(sender=self.__class__, changes=changes)
+            )
+
+        return changes
+
+    @staticmethod
+    def lock_change_sets():
+        """
+        Serialize publishers until the transaction ends, so change sets commit
+        in id order. Readers apply ids greater than the last one they saw,
+        and a lower id committed later would be skipped.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CHANGE_SET_LOCK_ID])
+        # SQLite already serializes write transactions
+
+    def delete_flight_events(self, queryset, batch_size: int = WRITE_BATCH_SIZE) -> int:
+        """
+        Delete the flight events of a queryset in batches of batch_size, each
+        committed with its own change set, so a large delete never holds
+        millions of ids or row locks at once. Returns the number deleted.
+        """
+        total = 0
+        while True:
+            with transaction.atomic():
+                deleted = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+                if not deleted:
+                    return total
+                FlightEvent.objects.filter(id__in=deleted).delete()
+                self.publish_changes(deleted=deleted)
+            total += len(deleted)
+
+    def revalidate_flight_events(self, queryset, batch_size: int = WRITE_BATCH_SIZE) -> Tuple[int, int]:
+        """
+        Apply the ingest rules to stored flight events with set-based queries:
+        city codes are upper-cased and events that are still invalid are deleted.
+        Works through the queryset in id order, batch_size rows per transaction,
+        each with its own change set. Returns the number updated and deleted.
+        """
+        total_updated = total_deleted = 0
+        last_id = 0
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return total_updated, total_deleted
+            last_id = ids[-1]
+
+            with transaction.atomic():
+                batch = FlightEvent.objects.filter(id__in=ids)
+                lowercase = batch.exclude(
+                    departure_city=Upper('departure_city'), arrival_city=Upper('arrival_city')
+                )
+                updated = list(lowercase.values_list('id', flat=True))
+                FlightEvent.objects.filter(id__in=updated).update(
+                    departure_city=Upper('departure_city'), arrival_city=Upper('arrival_city')
                 )
 
-                if created:
-                    saved_flight_events += 1
-                else:
-                    # Update existing record
-                    flight_event.departure_city = event_data['departure_city'].upper()
-                    flight_event.arrival_city = event_data['arrival_city'].upper()
-                    flight_event.arrival_datetime = self.parse_datetime(event_data['arrival_datetime'])
-                    flight_event.save()
-
-            except Exception as e:
-                print(f"Error saving flight event {event_data['flight_number']}: {e}")
-                continue
+                invalid = batch.alias(
+                    departure_city_length=Length('departure_city'),
+                    arrival_city_length=Length('arrival_city'),
+                ).filter(
+                    Q(arrival_datetime__lte=F('departure_datetime')) |
+                    ~Q(departure_city_length=3) |
+                    ~Q(arrival_city_length=3)
+                )
+                deleted = list(invalid.values_list('id', flat=True))
+                FlightEvent.objects.filter(id__in=deleted).delete()
 
-        return saved_flight_events
+                deleted_ids = set(deleted)
+                changes = self.publish_changes(
+                    updated=[event_id for event_id in updated if event_id not in deleted_ids],
+                    deleted=deleted
+                )
+            total_updated += len(changes.updated)
+            total_deleted += len(changes.deleted)
 
 class JourneySearchService:
     MAX_CONNECTION_HOURS = 4
     MAX_TOTAL_HOURS = 24
 
+    def __init__(self, index: Optional[FlightIndex] = None):
+        # Search the in-memory index instead of the database when given
+        self.index = index
+
     @staticmethod
     def parse_date(date_str: str) -> Optional[datetime]:
         """Parse YYYY-MM-DD string to date object"""
@@ -103,6 +263,25 @@ class JourneySearchService:
         """Format datetime to required string format"""
         return dt.strftime('%Y-%m-%d %H:%M:%S')
 
+    def flights_from(self, city: str, start: datetime, end: datetime,
+                     to_city: Optional[str] = None, include_end: bool = False) -> List[FlightEvent]:
+        """Flights leaving city between start and end, ordered by departure"""
+        if self.index is not None:
+            flights = self.index.departures(city, start, end, include_end=include_end)
+            if to_city:
+                flights = [flight for flight in flights if flight.arrival_city == to_city]
+            return flights
+
+        end_lookup = 'departure_datetime__lte' if include_end else 'departure_datetime__lt'
+        flights = FlightEvent.objects.filter(
+            departure_city=city,
+            departure_datetime__gte=start,
+            **{end_lookup: end}
+        )
+        if to_city:
+            flights = flights.filter(arrival_city=to_city)
+        return flights.order_by('departure_datetime')
+
     def find_connecting_flights(self, first_leg: FlightEvent, to_city: str, results: List[Dict]):
         """Find connecting flights"""
 
@@ -111,12 +290,10 @@ class JourneySearchService:
         connection_end = connection_start + timedelta(hours=self.MAX_CONNECTION_HOURS)
 
         # Search connecting flights
-        second_legs = FlightEvent.objects.filter(
-            departure_city=first_leg.arrival_city,
-            departure_datetime__gte=connection_start,
-            departure_datetime__lte=connection_end,
-            arrival_city=to_city.upper()
-        ).order_by('departure_datetime')
+        second_legs = self.flights_from(
+            first_leg.arrival_city, connection_start, connection_end,
+            to_city=to_city.upper(), include_end=True
+        )
 
         for second_leg in second_legs:
             total_duration = second_leg.arrival_datetime - first_leg.departure_datetime
@@ -138,7 +315,8 @@ class JourneySearchService:
             departure_datetime__lt=end
         ).values_list('arrival_city', flat=True).distinct()
 
-        return list(destinations)
+        with search_reads():
+            return list(destinations)
 
     def get_departure_times(self, from_city: str, to_city: str, date_str: str) -> List[datetime]:
         """Get departure times for a specific date and city"""
@@ -156,12 +334,11 @@ class JourneySearchService:
             departure_datetime__lt=end
         ).values_list('departure_datetime', flat=True).order_by('departure_datetime')
 
-        return list(departure_times)
-
-    def search_journeys(self, date_str: str, from_city: str, to_city: str) -> List[Dict]:
-        """Search for journeys between two cities and date"""
+        with search_reads():
+            return list(departure_times)
 
-        # Validate data
+    def validate_search(self, date_str: str, from_city: str, to_city: str):
+        """Validate search parameters and return the parsed date"""
         date = self.parse_date(date_str)
         if date is None:
             raise ValueError("Invalid date format. Use YYYY-MM-DD")
@@ -169,33 +346,65 @@ class JourneySearchService:
         if not from_city or not to_city or len(from_city) != 3 or len(to_city) != 3:
             raise ValueError("City codes must be 3 letters")
 
+        return date
+
+    def dataset_version(self) -> Tuple[int, Optional[datetime]]:
+        """Id and creation time of the latest change set visible to the search"""
+        change_sets = FlightEventChangeSet.objects.order_by('-id')
+        if self.index is not None:
+            change_sets = change_sets.filter(id__lte=self.index.version)
+
+        with search_reads():
+            latest = change_sets.values_list('id', 'created_at').first()
+
+        return latest or (0, None)
+
+    def search_journeys(self, date_str: str, from_city: str, to_city: str) -> List[Dict]:
+        """Search for journeys between two cities and date"""
+        journeys, _ = self.search_journeys_within(date_str, from_city, to_city)
+        return journeys
+
+    def search_journeys_within(self, date_str: str, from_city: str, to_city: str,
+                               budget: Optional[float] = None) -> Tuple[List[Dict], bool]:
+        """
+        Search for journeys, giving up after budget seconds.
+        Returns the journeys found and whether the search was truncated.
+        """
+        deadline = time.monotonic() + budget if budget is not None else None
+
+        # Validate data
+        date = self.validate_search(date_str, from_city, to_city)
+
         # Convert a datetime timezone UTC
         start = timezone.make_aware(datetime.combine(date, datetime.min.time()))
         end = start + timedelta(days=1)
 
-        # First leg connection
-        first_legs = FlightEvent.objects.filter(
-            departure_city=from_city.upper(),
-            departure_datetime__gte=start,
-            departure_datetime__lt=end
-        ).order_by('departure_datetime')
-
         results = []
+        truncated = False
+
+        # Database reads go to a read replica when one is configured
+        with search_reads() if self.index is None else nullcontext():
+            # First leg connection
+            first_legs = self.flights_from(from_city.upper(), start, end)
+
+            for first_leg in first_legs:
+                if deadline is not None and time.monotonic() > deadline:
+                    truncated = True
+                    break
 
-        for first_leg in first_legs:
-            # Direct flight
-            if first_leg.arrival_city == to_city.upper():
-                total_duration = first_leg.arrival_datetime - first_leg.departure_datetime
-                if total_duration <= timedelta(hours=self.MAX_TOTAL_HOURS):
-                    results.append(self.journey_response([first_leg], connections=0))
+                # Direct flight
+                if first_leg.arrival_city == to_city.upper():
+                    total_duration = first_leg.arrival_datetime - first_leg.departure_datetime
+                    if total_duration <= timedelta(hours=self.MAX_TOTAL_HOURS):
+                        results.append(self.journey_response([first_leg], connections=0))
 
-            # connecting flight
-            self.find_connecting_flights(first_leg, to_city, results)
+                # connecting flight
+                self.find_connecting_flights(first_leg, to_city, results)
 
         # Order by departure_time
         results.sort(key=lambda x: x['path'][0]['departure_time'])
 
-        return results
+        return results, truncated
 
     def journey_response(self, legs: List[FlightEvent], connections: int) -> Dict:
         """Journey response """
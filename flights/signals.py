@@ -0,0 +1,14 @@
+from django.dispatch import Signal, receiver
+
+# Sent after an ingest commits with the FlightEventChangeSet as ``changes``
+flight_events_changed = Signal()
+
+
+@receiver(flight_events_changed)
+def apply_changes_to_index(sender, changes, **kwargs):
+    """Keep the in-process flight index up to date without a full reload"""
+    from .index import flight_index
+
+    if flight_index.loaded:
+        flight_index.apply(changes)
+
@@ -1,12 +1,32 @@
-from django.test import TestCase
+import copy
+import json
+import os
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.db.models.sql.query import ExplainInfo
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 import datetime as datetime
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .services import FlightEventService
+from .services import FlightEventService, JourneySearchService
+from .index import FlightIndex, flight_index
+from .executor import SearchExecutor, SearchRejected
+from .views import search_digest
+from .admin import EstimatedCountPaginator
+from . import routers, warmup
 from django.utils import timezone
 from rest_framework.test import APIClient
-from .models import FlightEvent
+from .models import FlightEvent, FlightEventChangeSet
 from .serializers import FlightEventSerializer, JourneySerializer
 
 #### Test serializers
@@ -132,6 +152,7 @@ class JourneySearchAPITest(TestCase):
     def setUp(self):
         self.client = APIClient()
         self.base_url = '/journeys/search/'
+        cache.clear()
 
         # Create test journeys
         # Vuelo directo BUE -> MAD
@@ -228,3 +249,547 @@ class JourneySearchAPITest(TestCase):
         })
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 0)
+
+
+##### Test ingest
+EVENTS_DATA = [
+    {
+        'flight_number': 'X123',
+        'departure_city': 'bue',
+        'arrival_city': 'MAD',
+        'departure_datetime': '2024-09-12T12:00:00.000Z',
+        'arrival_datetime': '2024-09-13T00:00:00.000Z'
+    },
+    {
+        'flight_number': 'X1234',
+        'departure_city': 'MAD',
+        'arrival_city': 'BOG',
+        'departure_datetime': '2024-09-13T02:00:00.000Z',
+        'arrival_datetime': '2024-09-13T03:00:00.000Z'
+    },
+]
+
+
+class FlightEventIngestTests(TestCase):
+    def setUp(self):
+        self.service = FlightEventService()
+        self.events_data = copy.deepcopy(EVENTS_DATA)
+
+    def test_ingest_inserts_new_events(self):
+        changes = self.service.ingest_flight_events(self.events_data)
+        self.assertEqual(len(changes.inserted), 2)
+        self.assertEqual(FlightEvent.objects.filter(departure_city='BUE').count(), 1)
+        self.assertEqual(FlightEventChangeSet.objects.count(), 1)
+
+    def test_ingest_same_feed_is_empty_change_set(self):
+        self.service.ingest_flight_events(self.events_data)
+        changes = self.service.ingest_flight_events(self.events_data)
+        self.assertTrue(changes.is_empty)
+        self.assertEqual(FlightEventChangeSet.objects.count(), 1)
+
+    def test_ingest_updates_and_prunes(self):
+        self.service.ingest_flight_events(self.events_data)
+        self.events_data[0]['arrival_city'] = 'BCN'
+        later_flight = {
+            'flight_number': 'X999',
+            'departure_city': 'BOG',
+            'arrival_city': 'BUE',
+            'departure_datetime': '2024-09-14T02:00:00.000Z',
+            'arrival_datetime': '2024-09-14T09:00:00.000Z'
+        }
+        changes = self.service.ingest_flight_events([self.events_data[0], later_flight], prune=True)
+        self.assertEqual(len(changes.inserted), 1)
+        self.assertEqual(len(changes.updated), 1)
+        self.assertEqual(len(changes.deleted), 1)
+        self.assertFalse(FlightEvent.objects.filter(flight_number='X1234').exists())
+
+    def test_prune_keeps_flights_outside_the_feed_window(self):
+        self.service.ingest_flight_events(self.events_data)
+        # Same flight number, next day: X1234 departs after the feed's window
+        self.events_data[0]['departure_datetime'] = '2024-09-13T01:00:00.000Z'
+        self.events_data[0]['arrival_datetime'] = '2024-09-13T13:00:00.000Z'
+        changes = self.service.ingest_flight_events(self.events_data[:1], prune=True)
+        self.assertEqual(len(changes.inserted), 1)
+        self.assertEqual(changes.deleted, [])
+        self.assertEqual(FlightEvent.objects.filter(flight_number='X123').count(), 2)
+        self.assertTrue(FlightEvent.objects.filter(flight_number='X1234').exists())
+
+    def test_change_set_publishers_are_serialized_on_postgres(self):
+        from .services import CHANGE_SET_LOCK_ID
+        with mock.patch('flights.services.connection') as connection:
+            connection.vendor = 'postgresql'
+            self.service.ingest_flight_events(self.events_data)
+        connection.cursor.return_value.__enter__.return_value.execute.assert_called_once_with(
+            "SELECT pg_advisory_xact_lock(%s)", [CHANGE_SET_LOCK_ID]
+        )
+
+    def test_ingest_publishes_change_set(self):
+        received = []
+
+        def listener(sender, changes, **kwargs):
+            received.append(changes)
+
+        from .signals import flight_events_changed
+        flight_events_changed.connect(listener)
+        self.addCleanup(flight_events_changed.disconnect, listener)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.ingest_flight_events(self.events_data)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(len(received[0].inserted), 2)
+
+    def test_ingest_skips_malformed_items(self):
+        malformed = [
+            None,
+            {**EVENTS_DATA[0], 'departure_city': None},
+            {**EVENTS_DATA[0], 'departure_datetime': 1726142400},
+            {**EVENTS_DATA[0], 'flight_number': 123},
+        ]
+        changes = self.service.ingest_flight_events(malformed + self.events_data[1:])
+        self.assertEqual(len(changes.inserted), 1)
+
+    def test_scheduler_survives_database_errors(self):
+        err = StringIO()
+        with mock.patch.object(FlightEventService, 'fetch_flight_events', return_value=self.events_data), \
+                mock.patch.object(FlightEventService, 'ingest_flight_events', side_effect=OperationalError('gone')):
+            call_command('run_ingest_scheduler', '--once', stdout=StringIO(), stderr=err)
+        self.assertIn('Error ingesting flight events: gone', err.getvalue())
+
+    def test_scheduler_runs_once(self):
+        out = StringIO()
+        with mock.patch.object(FlightEventService, 'fetch_flight_events', return_value=self.events_data):
+            call_command('run_ingest_scheduler', '--once', stdout=out)
+        self.assertIn('2 inserted', out.getvalue())
+        self.assertEqual(FlightEvent.objects.count(), 2)
+
+
+class FlightIndexTests(TestCase):
+    def setUp(self):
+        self.service = FlightEventService()
+        self.service.ingest_flight_events(copy.deepcopy(EVENTS_DATA))
+        self.index = FlightIndex()
+        self.index.load()
+
+    def test_index_search_matches_database(self):
+        from_db = JourneySearchService().search_journeys('2024-09-12', 'BUE', 'BOG')
+        from_index = JourneySearchService(index=self.index).search_journeys('2024-09-12', 'BUE', 'BOG')
+        self.assertEqual(len(from_db), 1)
+        self.assertEqual(from_index, from_db)
+
+    def test_index_sync_applies_change_sets(self):
+        self.service.ingest_flight_events([{
+            'flight_number': 'X999',
+            'departure_city': 'BUE',
+            'arrival_city': 'BOG',
+            'departure_datetime': '2024-09-12T15:00:00.000Z',
+            'arrival_datetime': '2024-09-12T20:00:00.000Z'
+        }])
+        self.index.sync()
+        self.assertEqual(len(self.index), 3)
+        self.assertIn(('BUE', 'BOG'), self.index.routes())
+
+    def test_index_routes_follow_updates(self):
+        events_data = copy.deepcopy(EVENTS_DATA)
+        events_data[0]['arrival_city'] = 'BCN'
+        self.service.ingest_flight_events(events_data)
+        self.index.sync()
+        self.assertEqual(self.index.routes(), {('BUE', 'BCN'), ('MAD', 'BOG')})
+
+
+##### Test database routing
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        routers._unhealthy_until.clear()
+        routers._primary_version = (0, None)
+        self.router = routers.ReplicaRouter()
+
+    def test_search_reads_use_replica(self):
+        with mock.patch.object(routers, 'latest_change_set', return_value=3):
+            with routers.search_reads():
+                self.assertEqual(self.router.db_for_read(FlightEvent), 'replica_1')
+        self.assertIsNone(self.router.db_for_read(FlightEvent))
+        self.assertEqual(self.router.db_for_write(FlightEvent), 'default')
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        def latest(alias):
+            if alias == 'replica_1':
+                raise OperationalError('connection refused')
+            return 3
+
+        with mock.patch.object(routers, 'latest_change_set', side_effect=latest) as latest_change_set:
+            with self.assertLogs('flights.routers', 'WARNING'):
+                self.assertEqual(routers.choose_read_alias(), 'default')
+            # Not retried until DATABASE_REPLICA_RETRY has passed
+            self.assertEqual(routers.choose_read_alias(), 'default')
+            self.assertEqual(latest_change_set.call_count, 2)
+
+    def test_lagging_replica_reads_from_primary(self):
+        # The replica has not replayed change set 4 yet
+        versions = {'default': 4, 'replica_1': 3}
+        with mock.patch.object(routers, 'latest_change_set', side_effect=versions.get):
+            self.assertEqual(routers.choose_read_alias(), 'default')
+        versions['replica_1'] = 4
+        with mock.patch.object(routers, 'latest_change_set', side_effect=versions.get):
+            self.assertEqual(routers.choose_read_alias(), 'replica_1')
+
+    def test_primary_change_set_is_reused_within_ttl(self):
+        with mock.patch.object(routers, 'latest_change_set', return_value=3) as latest_change_set:
+            routers.choose_read_alias()
+            routers.choose_read_alias()
+        primary_reads = [args for args in latest_change_set.call_args_list if args == mock.call('default')]
+        self.assertEqual(len(primary_reads), 1)
+
+    def test_search_request_chooses_alias_once(self):
+        FlightEventService().ingest_flight_events(copy.deepcopy(EVENTS_DATA))
+        with mock.patch.object(routers, 'choose_read_alias', return_value='default') as choose_read_alias:
+            response = self.client.get('/journeys/search/', {'date': '2024-09-12', 'from': 'BUE', 'to': 'BOG'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(choose_read_alias.call_count, 1)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica_1', 'flights'))
+        self.assertIsNone(self.router.allow_migrate('default', 'flights'))
+
+
+##### Test load generator
+class ReplaySearchesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def write_log(self, entries):
+        log = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False)
+        self.addCleanup(os.remove, log.name)
+        with log:
+            for entry in entries:
+                log.write(json.dumps(entry) + '\n')
+        return log.name
+
+    def test_replay_reports_latency_and_errors(self):
+        log = self.write_log([
+            {'date': '2024-09-12', 'from': 'BUE', 'to': 'MAD', 'options': {}},
+            {'date': '2024/09/12', 'from': 'BUE', 'to': 'MAD', 'options': {}},
+        ])
+        out = StringIO()
+        call_command('replay_searches', log, '--concurrency', '2', stdout=out)
+        self.assertIn('Requests:      2', out.getvalue())
+        self.assertIn('p95', out.getvalue())
+        self.assertIn('4xx: 1', out.getvalue())
+
+    def test_repeated_search_is_cache_hit(self):
+        params = {'date': '2024-09-12', 'from': 'BUE', 'to': 'MAD'}
+        self.assertEqual(self.client.get('/journeys/search/', params)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/journeys/search/', params)['X-Cache'], 'HIT')
+
+    def test_search_requests_are_sampled(self):
+        sample_file = self.write_log([])
+        with self.settings(SEARCH_SAMPLE_RATE=1, SEARCH_SAMPLE_FILE=sample_file):
+            response = self.client.get('/journeys/search/', {'date': '2024-09-12', 'from': 'BUE', 'to': 'MAD'})
+        self.assertEqual(response.status_code, 200)
+        with open(sample_file) as samples:
+            self.assertEqual(
+                [json.loads(line) for line in samples],
+                [{'date': '2024-09-12', 'from': 'BUE', 'to': 'MAD', 'options': {}}]
+            )
+
+
+##### Test conditional requests
+class JourneySearchConditionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = '/journeys/search/'
+        self.params = {'date': '2024-09-12', 'from': 'BUE', 'to': 'MAD'}
+        FlightEventService().ingest_flight_events(copy.deepcopy(EVENTS_DATA))
+
+    def test_search_sets_validators_and_cache_control(self):
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.url, self.params)['ETag']
+        with mock.patch.object(JourneySearchService, 'search_journeys') as search_journeys:
+            response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        search_journeys.assert_not_called()
+
+    def test_not_modified_since_last_change_set(self):
+        last_modified = self.client.get(self.url, self.params)['Last-Modified']
+        response = self.client.get(self.url, self.params, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_change_set_changes_etag(self):
+        etag = self.client.get(self.url, self.params)['ETag']
+        events_data = copy.deepcopy(EVENTS_DATA)
+        events_data[0]['arrival_city'] = 'BCN'
+        FlightEventService().ingest_flight_events(events_data)
+
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 0)
+
+    def test_etag_ignores_city_case(self):
+        etag = self.client.get(self.url, self.params)['ETag']
+        response = self.client.get(self.url, {**self.params, 'to': 'mad'})
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_rendered_media_type(self):
+        json_etag = self.client.get(self.url, self.params, HTTP_ACCEPT='application/json')['ETag']
+        html_response = self.client.get(self.url, self.params, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=json_etag)
+        self.assertEqual(html_response.status_code, 200)
+        self.assertNotEqual(html_response['ETag'], json_etag)
+
+
+##### Test warm-up
+class WarmUpTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        FlightEventService().ingest_flight_events(copy.deepcopy(EVENTS_DATA))
+        warmup_file = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False)
+        self.addCleanup(os.remove, warmup_file.name)
+        with warmup_file:
+            warmup_file.write(json.dumps({'date': '2024-09-12', 'from': 'BUE', 'to': 'BOG', 'options': {}}) + '\n')
+            warmup_file.write(json.dumps({'date': 'bad', 'from': 'BUE', 'to': 'BOG', 'options': {}}) + '\n')
+        self.warmup_file = warmup_file.name
+
+    def test_warm_up_fills_search_cache(self):
+        with self.settings(SEARCH_WARMUP_FILE=self.warmup_file):
+            warmup.warm_up()
+        response = self.client.get('/journeys/search/', {'date': '2024-09-12', 'from': 'BUE', 'to': 'BOG'})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(response.data), 1)
+
+    def test_warm_up_loads_index(self):
+        from .index import flight_index
+        self.addCleanup(setattr, flight_index, 'version', None)
+        with self.settings(SEARCH_WARMUP_FILE=None, FLIGHT_SEARCH_USE_INDEX=True):
+            warmup.warm_up()
+        self.assertEqual(len(flight_index), 2)
+
+    def test_forked_worker_catches_up_with_new_change_sets(self):
+        from .index import flight_index
+        self.addCleanup(setattr, flight_index, 'version', None)
+        with self.settings(SEARCH_WARMUP_FILE=self.warmup_file, FLIGHT_SEARCH_USE_INDEX=True):
+            warmup.warm_up()
+            events_data = copy.deepcopy(EVENTS_DATA)
+            events_data[0]['arrival_city'] = 'BCN'
+            # Published after boot: on_commit never runs inside the test transaction
+            FlightEventService().ingest_flight_events(events_data)
+            boot_version = flight_index.version
+            warmup.refresh_worker()
+            self.assertGreater(flight_index.version, boot_version)
+            self.assertEqual(flight_index.version, warmup.warmed_version)
+            response = self.client.get('/journeys/search/', {'date': '2024-09-12', 'from': 'BUE', 'to': 'BOG'})
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_warm_up_survives_database_errors(self):
+        from .index import flight_index
+        with mock.patch.object(flight_index, 'load', side_effect=OperationalError('relation does not exist')), \
+                self.settings(FLIGHT_SEARCH_USE_INDEX=True), \
+                self.assertLogs('flights.warmup', 'WARNING'):
+            warmup.warm_up()
+        self.assertFalse(flight_index.loaded)
+
+        with mock.patch.object(JourneySearchService, 'dataset_version', side_effect=OperationalError), \
+                self.assertLogs('flights.warmup', 'WARNING'):
+            warmup.refresh_worker()
+
+    def test_startup_report_lists_steps(self):
+        warmup.warm_imports()
+        report = warmup.startup_report()
+        self.assertTrue(any('import flights.views' in line for line in report))
+        self.assertTrue(report[-1].startswith('total'))
+
+
+##### Test search time budget and executor
+class SearchBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        FlightEventService().ingest_flight_events(copy.deepcopy(EVENTS_DATA))
+
+    def test_exhausted_budget_truncates_search(self):
+        journeys, truncated = JourneySearchService().search_journeys_within('2024-09-12', 'BUE', 'BOG', budget=-1)
+        self.assertTrue(truncated)
+        self.assertEqual(journeys, [])
+
+    def test_search_within_budget_is_complete(self):
+        journeys, truncated = JourneySearchService().search_journeys_within('2024-09-12', 'BUE', 'BOG', budget=60)
+        self.assertFalse(truncated)
+        self.assertEqual(len(journeys), 1)
+
+    def test_truncated_response_is_flagged_and_not_cached(self):
+        with self.settings(SEARCH_TIME_BUDGET=-1):
+            response = self.client.get('/journeys/search/', {'date': '2024-09-12', 'from': 'BUE', 'to': 'BOG'})
+        self.assertEqual(response['X-Search-Truncated'], 'true')
+        self.assertIn('no-store', response['Cache-Control'])
+        response = self.client.get('/journeys/search/', {'date': '2024-09-12', 'from': 'BUE', 'to': 'BOG'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotIn('X-Search-Truncated', response)
+
+    def test_executor_searches_index_snapshot(self):
+        self.addCleanup(setattr, flight_index, 'version', None)
+        flight_index.load()
+        executor = SearchExecutor(workers=1, max_queue=0)
+        self.addCleanup(lambda: executor._pool and executor._pool.shutdown())
+
+        journeys, truncated = executor.search('2024-09-12', 'BUE', 'BOG', budget=30)
+        self.assertFalse(truncated)
+        self.assertEqual(journeys[0]['path'][1]['flight_number'], 'X1234')
+        self.assertEqual(executor.stats()['completed'], 1)
+
+    def test_executor_rejects_when_queue_is_full(self):
+        executor = SearchExecutor(workers=1, max_queue=0)
+        executor.pending = 1
+        with self.assertRaises(SearchRejected):
+            executor.search('2024-09-12', 'BUE', 'BOG', budget=1)
+        self.assertEqual(executor.stats()['rejected'], 1)
+        self.assertEqual(executor.stats()['queue_depth'], 1)
+
+    def test_timed_out_search_keeps_its_slot_until_it_ends(self):
+        executor = SearchExecutor(workers=1, max_queue=0)
+        future = Future()
+        future.set_running_or_notify_cancel()
+        executor._get_pool = mock.Mock(return_value=mock.Mock(submit=mock.Mock(return_value=future)))
+
+        with mock.patch('flights.executor.RESULT_GRACE', 0):
+            self.assertEqual(executor.search('2024-09-12', 'BUE', 'BOG', budget=0.01), ([], True))
+        self.assertEqual(executor.stats()['queue_depth'], 1)
+        with self.assertRaises(SearchRejected):
+            executor.search('2024-09-12', 'BUE', 'BOG', budget=0.01)
+
+        future.set_result(([], False))
+        self.assertEqual(executor.stats()['queue_depth'], 0)
+
+    def test_pool_broken_while_idle_is_replaced(self):
+        executor = SearchExecutor(workers=1, max_queue=0)
+        broken_pool = mock.Mock()
+        broken_pool.submit.side_effect = BrokenProcessPool
+        future = Future()
+        future.set_result((['journey'], False))
+        new_pool = mock.Mock(submit=mock.Mock(return_value=future))
+
+        with mock.patch('flights.executor.ProcessPoolExecutor', side_effect=[broken_pool, new_pool]):
+            executor._get_pool()
+            self.assertEqual(executor.search('2024-09-12', 'BUE', 'BOG', budget=1), (['journey'], False))
+        self.assertIs(executor._pool, new_pool)
+        self.assertEqual(executor.stats()['queue_depth'], 0)
+
+    def test_pool_etag_uses_index_version(self):
+        self.addCleanup(setattr, flight_index, 'version', None)
+        flight_index.load()
+        # Not applied to the index until its next sync
+        events_data = copy.deepcopy(EVENTS_DATA)
+        events_data[0]['arrival_city'] = 'BCN'
+        FlightEventService().ingest_flight_events(events_data)
+
+        with mock.patch('flights.views.search_executor') as executor:
+            executor.enabled = True
+            executor.search.return_value = ([], False)
+            response = self.client.get('/journeys/search/', {'date': '2024-09-12', 'from': 'BUE', 'to': 'BOG'})
+        digest = search_digest(flight_index.version, '2024-09-12', 'BUE', 'BOG', 'application/json')
+        self.assertEqual(response['ETag'], f'"{digest}"')
+
+    def test_rejected_search_returns_503(self):
+        with mock.patch('flights.views.search_executor') as executor:
+            executor.enabled = True
+            executor.search.side_effect = SearchRejected('Too many searches in progress')
+            response = self.client.get('/journeys/search/', {'date': '2024-09-12', 'from': 'BUE', 'to': 'BOG'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+##### Test admin
+class FlightEventAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.url = reverse('admin:flights_flightevent_changelist')
+        FlightEventService().ingest_flight_events(copy.deepcopy(EVENTS_DATA))
+
+    def test_changelist_filters_from_routes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '?departure_city=MAD')
+        self.assertContains(response, '?arrival_city=BOG')
+
+    def test_filtered_count_uses_planner_estimate_on_postgres(self):
+        def explain(queryset, format=None):
+            # Django's own formatting of the row psycopg2 returns: the json column decoded to a list
+            compiler = queryset.query.get_compiler(using=queryset.db)
+            compiler.query.explain_info = ExplainInfo(format, {})
+            compiler.execute_sql = lambda: iter([[([{'Plan': {'Node Type': 'Seq Scan', 'Plan Rows': 250000}}],)]])
+            return '\n'.join(compiler.explain_query())
+
+        with mock.patch('flights.admin.connections') as connections, \
+                mock.patch.object(QuerySet, 'explain', autospec=True, side_effect=explain):
+            connections.__getitem__.return_value.vendor = 'postgresql'
+            paginator = EstimatedCountPaginator(FlightEvent.objects.filter(departure_city='BUE').order_by('id'), 100)
+            self.assertEqual(paginator.count, 250000)
+
+    def test_date_hierarchy_years_from_first_and_last_flight(self):
+        FlightEvent.objects.create(
+            flight_number='X999',
+            departure_city='BUE',
+            arrival_city='MAD',
+            departure_datetime=datetime.datetime(2026, 3, 1, 12, tzinfo=datetime.timezone.utc),
+            arrival_datetime=datetime.datetime(2026, 3, 1, 14, tzinfo=datetime.timezone.utc)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, '?departure_datetime__year=2024')
+        self.assertContains(response, '?departure_datetime__year=2026')
+        self.assertFalse(any('TRUNC' in query['sql'].upper() for query in queries))
+
+        response = self.client.get(self.url, {'departure_datetime__year': 2024})
+        self.assertContains(response, 'departure_datetime__month=9')
+
+    def test_search_by_flight_number_prefix_and_city(self):
+        response = self.client.get(self.url, {'q': 'X123'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get(self.url, {'q': 'bog'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(self.url, {'q': '123'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_delete_past_flights_action(self):
+        future = FlightEvent.objects.create(
+            flight_number='X999',
+            departure_city='BUE',
+            arrival_city='MAD',
+            departure_datetime=timezone.now() + datetime.timedelta(days=1),
+            arrival_datetime=timezone.now() + datetime.timedelta(days=1, hours=2)
+        )
+        response = self.client.post(self.url, {
+            'action': 'delete_past_flights',
+            'select_across': 1,
+            '_selected_action': [future.id],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(FlightEvent.objects.values_list('flight_number', flat=True)), ['X999'])
+        self.assertEqual(len(FlightEventChangeSet.objects.latest('id').deleted), 2)
+
+    def test_delete_in_batches_with_a_change_set_each(self):
+        deleted = FlightEventService().delete_flight_events(FlightEvent.objects.all(), batch_size=1)
+        self.assertEqual(deleted, 2)
+        self.assertFalse(FlightEvent.objects.exists())
+        change_sets = FlightEventChangeSet.objects.order_by('-id')[:2]
+        self.assertEqual([len(changes.deleted) for changes in change_sets], [1, 1])
+
+    def test_revalidate_flights_action(self):
+        FlightEvent.objects.filter(flight_number='X123').update(departure_city='bue')
+        FlightEvent.objects.filter(flight_number='X1234').update(arrival_city='BOGO')
+        updated, deleted = FlightEventService().revalidate_flight_events(FlightEvent.objects.all(), batch_size=1)
+        self.assertEqual((updated, deleted), (1, 1))
+        self.assertEqual(FlightEvent.objects.get().departure_city, 'BUE')
+        # One change set per batch
+        change_sets = FlightEventChangeSet.objects.order_by('-id')[:2]
+        self.assertEqual([(changes.updated, len(changes.deleted)) for changes in change_sets],
+                         [([], 1), ([FlightEvent.objects.get().id], 0)])
+
+    def test_paginator_counts_exactly_outside_postgres(self):
+        self.assertEqual(EstimatedCountPaginator(FlightEvent.objects.order_by('id'), 10).count, 2)
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import JourneySearchView
+from .views import JourneySearchView, SearchMetricsView
 
 urlpatterns = [
     path('search/', JourneySearchView.as_view(), name='journey-search'),
+    path('search/metrics/', SearchMetricsView.as_view(), name='journey-search-metrics'),
 ]
\ No newline at end of file
@@ -1,18 +1,86 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from .executor import SearchRejected, search_executor
+from .index import flight_index
+from .routers import search_reads
 from .services import FlightEventService, JourneySearchService
 
+def search_digest(version: int, date_str: str, from_city: str, to_city: str, media_type: str = '') -> str:
+    """
+    Digest of the dataset version and the normalized search query. ETags also
+    include the rendered media type, since JSON and HTML bodies differ.
+    """
+    query = f"{version}:{date_str}:{from_city.upper()}:{to_city.upper()}"
+    if media_type:
+        query = f"{query}:{media_type}"
+    return hashlib.sha1(query.encode()).hexdigest()
+
+
+# Cache 15 minutes
+SEARCH_CACHE_TIMEOUT = 60 * 15
+
+
+def index_enabled() -> bool:
+    """Searches run on the in-memory index, always the case with the search pool"""
+    return settings.FLIGHT_SEARCH_USE_INDEX or search_executor.enabled
+
+
+def cached_journeys(search_service: JourneySearchService, digest: str, date_str: str,
+                    from_city: str, to_city: str, budget: Optional[float] = None) -> Tuple[List[Dict], bool, bool]:
+    """
+    Search results from the cache, searching on a miss within budget seconds.
+    Returns (journeys, hit, truncated); truncated results are not cached.
+    """
+    cache_key = f"journeys:{digest}"
+    journeys = cache.get(cache_key)
+    if journeys is not None:
+        return journeys, True, False
+
+    if budget is not None and search_executor.enabled:
+        journeys, truncated = search_executor.search(date_str, from_city, to_city, budget)
+    else:
+        journeys, truncated = search_service.search_journeys_within(date_str, from_city, to_city, budget)
+
+    if not truncated:
+        cache.set(cache_key, journeys, SEARCH_CACHE_TIMEOUT)
+    return journeys, False, truncated
+
+
 class JourneySearchView(APIView):
+    # Public endpoint: no session lookup, so responses don't vary on Cookie
+    authentication_classes = []
+
     def __init__(self):
         super().__init__()
-        self.search_service = JourneySearchService()
+        # The dataset version in ETags and cache keys must be the one searched
+        if index_enabled():
+            flight_index.sync(max_age=settings.FLIGHT_INDEX_SYNC_INTERVAL)
+            self.search_service = JourneySearchService(index=flight_index)
+        else:
+            self.search_service = JourneySearchService()
+
+    def cacheable(self, response, etag, last_modified):
+        """Validators and Cache-Control so browsers and CDNs can serve repeats"""
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, max_age=settings.SEARCH_CACHE_MAX_AGE)
+        patch_vary_headers(response, ['Accept'])
+        return response
 
-    # Cache 15 minutes
-    @method_decorator(cache_page(60 * 15))
     def get(self, request):
+        # One read alias for the whole request: dataset version and search
+        with search_reads():
+            return self.search(request)
+
+    def search(self, request):
         try:
             # Get params
             date_str = request.GET.get('date')
@@ -26,10 +94,41 @@ class JourneySearchView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Search journeys
-            journeys = self.search_service.search_journeys(date_str, from_city, to_city)
+            self.search_service.validate_search(date_str, from_city, to_city)
 
-            return Response(journeys)
+            # Answer revalidations before searching: the response only changes
+            # when an ingest publishes a new change set
+            version, modified = self.search_service.dataset_version()
+            digest = search_digest(version, date_str, from_city, to_city)
+            etag = quote_etag(search_digest(
+                version, date_str, from_city, to_city, request.accepted_renderer.media_type
+            ))
+            last_modified = int(modified.timestamp()) if modified else None
+
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return self.cacheable(not_modified, etag, last_modified)
+
+            # Search journeys, X-Cache tells load tests whether the cache answered
+            journeys, hit, truncated = cached_journeys(
+                self.search_service, digest, date_str, from_city, to_city,
+                budget=settings.SEARCH_TIME_BUDGET
+            )
+
+            response = Response(journeys, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+            if truncated:
+                # Partial results: flag them and keep them out of every cache
+                response['X-Search-Truncated'] = 'true'
+                patch_cache_control(response, no_store=True)
+                return response
+            return self.cacheable(response, etag, last_modified)
+
+        except SearchRejected as e:
+            return Response(
+                {'detail': str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'}
+            )
 
         except ValueError as e:
             return Response(
@@ -43,3 +142,11 @@ class JourneySearchView(APIView):
                 {'detail': 'Internal server error'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+
+class SearchMetricsView(APIView):
+    """Queue depth and outcome counters of this process' search executor"""
+
+    def get(self, request):
+        return Response(search_executor.stats())
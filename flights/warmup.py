@@ -0,0 +1,136 @@
+import importlib
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.db import DatabaseError
+from django.urls import reverse
+
+# Modules a search request imports lazily on first use
+SEARCH_MODULES = (
+    'rest_framework.views',
+    'rest_framework.response',
+    'rest_framework.renderers',
+    'rest_framework.parsers',
+    'rest_framework.negotiation',
+    'flights.serializers',
+    'flights.views',
+)
+
+logger = logging.getLogger(__name__)
+
+# (step, seconds) for each warm-up step, in order
+startup_timings: List[Tuple[str, float]] = []
+# Dataset version the search cache was last warmed for
+warmed_version: Optional[int] = None
+
+
+@contextmanager
+def timed(step: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings.append((step, time.perf_counter() - started))
+
+
+def warm_imports():
+    """Import the modules used to serve a search"""
+    for module in SEARCH_MODULES:
+        with timed(f"import {module}"):
+            importlib.import_module(module)
+
+
+def warm_up():
+    """
+    Build the search structures and fill the search cache, so the first
+    request is served at steady-state latency. With gunicorn preload this
+    runs once in the master and workers share the result copy-on-write.
+    Database errors are logged and the process starts cold.
+    """
+    from .index import flight_index
+    from .views import index_enabled
+
+    with timed('url resolver'):
+        reverse('journey-search')
+
+    try:
+        if index_enabled():
+            with timed('flight index'):
+                flight_index.load()
+
+        warm_search_cache()
+    except DatabaseError as e:
+        # Not migrated yet or the database is down: the first requests load it
+        logger.warning("Warm-up skipped, database unavailable: %s", e)
+
+
+def refresh_worker():
+    """
+    Catch up a worker forked from a preloaded master, which may be much
+    older than the worker when gunicorn recycles it: apply the change sets
+    published since then and re-warm the search cache for the new version.
+    Database errors are logged and the worker serves cold, as gunicorn halts
+    the whole server when a worker fails to boot.
+    """
+    from .index import flight_index
+    from .views import index_enabled
+
+    try:
+        if index_enabled():
+            with timed('flight index sync'):
+                flight_index.sync()
+
+        if search_service().dataset_version()[0] != warmed_version:
+            warm_search_cache()
+    except DatabaseError as e:
+        logger.warning("Worker refresh skipped, database unavailable: %s", e)
+
+
+def search_service():
+    from .index import flight_index
+    from .services import JourneySearchService
+    from .views import index_enabled
+
+    return JourneySearchService(index=flight_index if index_enabled() else None)
+
+
+def warm_search_cache():
+    """Cache the most frequent searches of SEARCH_WARMUP_FILE for the current dataset version"""
+    global warmed_version
+    from .middleware import read_search_log
+    from .views import cached_journeys, search_digest
+
+    warmup_file = settings.SEARCH_WARMUP_FILE
+    if not (warmup_file and os.path.exists(warmup_file)):
+        return
+
+    with timed('search cache'):
+        service = search_service()
+        version, _ = service.dataset_version()
+        # Most frequent searches first
+        searches = Counter(
+            (params.get('date'), params.get('from'), params.get('to'))
+            for params in read_search_log(warmup_file)
+        )
+        for (date_str, from_city, to_city), _ in searches.most_common(settings.SEARCH_WARMUP_LIMIT):
+            if not (date_str and from_city and to_city):
+                continue
+            try:
+                service.validate_search(date_str, from_city, to_city)
+            except ValueError:
+                continue
+            digest = search_digest(version, date_str, from_city, to_city)
+            cached_journeys(service, digest, date_str, from_city, to_city)
+        warmed_version = version
+
+
+def startup_report() -> List[str]:
+    """Lines describing the cost of each warm-up step"""
+    lines = [f"{step:<40} {seconds * 1000:8.1f} ms" for step, seconds in startup_timings]
+    total = sum(seconds for _, seconds in startup_timings)
+    lines.append(f"{'total':<40} {total * 1000:8.1f} ms")
+    return lines
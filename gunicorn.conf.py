@@ -0,0 +1,69 @@
+"""
+Gunicorn configuration for vuelos_kiu_api.
+
+With preload (default) the app, settings, flight index and search cache are
+built once in the master and shared copy-on-write by the forked workers,
+each of which then applies the ingests published since the master booted.
+Without preload each worker warms itself up before accepting requests.
+"""
+import gc
+import os
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vuelos_kiu_api.settings')
+os.environ.setdefault('FLIGHT_WARMUP', 'True')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '3'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+_config_loaded_at = time.perf_counter()
+
+if preload_app:
+    # No collections while preloading: freed slots in frozen pages would be
+    # reused after forking (see gc.freeze); workers enable the GC again
+    gc.disable()
+
+
+def warm_up(log, app_loaded_in):
+    from django.db import connections
+    from flights.warmup import startup_report, warm_up
+
+    warm_up()
+    # Connections opened while warming up must not be inherited by workers
+    connections.close_all()
+
+    log.info("Startup report (pid %s):", os.getpid())
+    log.info("%-40s %8.1f ms", 'load app (Django, DRF, settings)', app_loaded_in * 1000)
+    for line in startup_report():
+        log.info(line)
+
+
+def when_ready(server):
+    # Master, after the app was preloaded and before workers are forked
+    if preload_app:
+        warm_up(server.log, time.perf_counter() - _config_loaded_at)
+        # Move everything built so far (app, flight index, search cache) to the
+        # permanent generation: the cyclic GC would otherwise write to every
+        # object header in the workers and unshare the copy-on-write pages
+        gc.freeze()
+        server.log.info("Frozen %d objects before forking workers", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+    gc.enable()
+
+
+def post_worker_init(worker):
+    # Worker, after loading the app and before accepting requests
+    if not preload_app:
+        warm_up(worker.log, time.perf_counter() - worker.forked_at)
+        return
+
+    # Workers recycled by max_requests or after a crash are forked from the
+    # boot-time master: catch up with the ingests published since then
+    from flights.warmup import refresh_worker
+
+    refresh_worker()
+    worker.log.info("Worker %s refreshed in %.1f ms", os.getpid(), (time.perf_counter() - worker.forked_at) * 1000)
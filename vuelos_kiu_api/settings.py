@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'flights.middleware.SearchSamplingMiddleware',
 ]
 
 ROOT_URLCONF = 'vuelos_kiu_api.urls'
@@ -89,6 +90,9 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Conexiones persistentes, verificadas antes de reutilizarlas
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -99,6 +103,26 @@ if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
         'connect_timeout': 10,
     }
 
+# Réplicas de lectura para las búsquedas (DB_REPLICA_HOSTS=host[:puerto],...)
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = replica.strip().partition(':')
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['flights.routers.ReplicaRouter']
+
+# Segundos antes de volver a probar una réplica caída
+DATABASE_REPLICA_RETRY = int(os.getenv('DB_REPLICA_RETRY', '30'))
+# Segundos que se reutiliza el último change set leído del primario al elegir réplica
+DATABASE_PRIMARY_VERSION_TTL = float(os.getenv('DB_PRIMARY_VERSION_TTL', '1'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -146,3 +170,28 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10
 }
+
+# Ingesta periódica de eventos de vuelo (segundos entre consultas a la API)
+FLIGHT_INGEST_INTERVAL = int(os.getenv('FLIGHT_INGEST_INTERVAL', '60'))
+
+# Búsqueda sobre el índice en memoria, sincronizado con los change sets de la ingesta
+FLIGHT_SEARCH_USE_INDEX = os.getenv('FLIGHT_SEARCH_USE_INDEX', 'False') == 'True'
+FLIGHT_INDEX_SYNC_INTERVAL = int(os.getenv('FLIGHT_INDEX_SYNC_INTERVAL', '5'))
+
+# Muestreo de búsquedas a JSONL para replay_searches (0 desactiva el muestreo)
+SEARCH_SAMPLE_RATE = float(os.getenv('SEARCH_SAMPLE_RATE', '0'))
+SEARCH_SAMPLE_FILE = os.getenv('SEARCH_SAMPLE_FILE', str(BASE_DIR / 'search_samples.jsonl'))
+
+# Segundos que navegadores y CDNs pueden reutilizar una búsqueda sin revalidar
+SEARCH_CACHE_MAX_AGE = int(os.getenv('SEARCH_CACHE_MAX_AGE', '60'))
+
+# Precalentamiento al arrancar (lo activa gunicorn.conf.py): índice y caché de búsquedas
+FLIGHT_WARMUP = os.getenv('FLIGHT_WARMUP', 'False') == 'True'
+SEARCH_WARMUP_FILE = os.getenv('SEARCH_WARMUP_FILE', SEARCH_SAMPLE_FILE)
+SEARCH_WARMUP_LIMIT = int(os.getenv('SEARCH_WARMUP_LIMIT', '500'))
+
+# Límite de tiempo por búsqueda (segundos); al agotarse se devuelven resultados parciales
+SEARCH_TIME_BUDGET = float(os.getenv('SEARCH_TIME_BUDGET', '5'))
+# Pool de procesos para las búsquedas sobre el índice en memoria (0 desactiva el pool)
+SEARCH_POOL_WORKERS = int(os.getenv('SEARCH_POOL_WORKERS', '0'))
+SEARCH_POOL_QUEUE = int(os.getenv('SEARCH_POOL_QUEUE', '8'))